@@ -5,6 +5,7 @@ CREATE TABLE IF NOT EXISTS tags (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT -- will be a list of datetime
 );
 
@@ -19,6 +20,7 @@ CREATE TABLE IF NOT EXISTS persons (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT, -- will be a list of datetime
 
        UNIQUE (first_name, last_name, middle_name, date_of_birth)
@@ -32,6 +34,7 @@ CREATE TABLE IF NOT EXISTS entities (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT -- will be a list of datetime
 );
 
@@ -45,6 +48,7 @@ CREATE TABLE IF NOT EXISTS signatures (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT, -- will be a list of datetime
 
        CHECK (NOT (is_person AND is_entity)) -- Cannot be both person and entity
@@ -61,6 +65,7 @@ CREATE TABLE IF NOT EXISTS addresses (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT, -- will be a list of datetime
 
        UNIQUE (longitude, latitude, apartment) -- added apartment just in case if same location but diff apartments
@@ -76,6 +81,7 @@ CREATE TABLE IF NOT EXISTS emails (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT -- will be a list of datetime
 );
 
@@ -91,5 +97,60 @@ CREATE TABLE IF NOT EXISTS phone_numbers (
        description TEXT,
        date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
        last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+       last_updated DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')), -- UTC, used as sync watermark
        update_history TEXT -- will be a list of datetime
 );
+
+-- usage statistics; maintained by triggers created in DBManager so reads do not scan the tables
+CREATE TABLE IF NOT EXISTS table_stats (
+       table_name TEXT PRIMARY KEY,
+       row_count INTEGER NOT NULL DEFAULT 0,
+       last_modified DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS entry_stats (
+       table_name TEXT NOT NULL,
+       entry_id TEXT NOT NULL,
+       update_count INTEGER NOT NULL DEFAULT 0,
+       last_updated DATETIME,
+
+       PRIMARY KEY (table_name, entry_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_entry_stats_update_count ON entry_stats (update_count);
+
+-- tombstones of deleted entries; maintained by triggers created in DBManager for incremental export
+CREATE TABLE IF NOT EXISTS deleted_entries (
+       table_name TEXT NOT NULL,
+       entry_id TEXT NOT NULL,
+       deleted_at DATETIME NOT NULL,
+
+       PRIMARY KEY (table_name, entry_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_entries_deleted_at ON deleted_entries (table_name, deleted_at);
+
+-- blocking keys for duplicate detection; built on the first dedupe run, then
+-- refreshed for the entries that triggers mark in dedupe_dirty
+CREATE TABLE IF NOT EXISTS dedupe_keys (
+       table_name TEXT NOT NULL,
+       block_key TEXT NOT NULL,
+       entry_id TEXT NOT NULL,
+
+       PRIMARY KEY (table_name, block_key, entry_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_dedupe_keys_entry ON dedupe_keys (table_name, entry_id);
+
+CREATE TABLE IF NOT EXISTS dedupe_dirty (
+       table_name TEXT NOT NULL,
+       entry_id TEXT NOT NULL,
+
+       PRIMARY KEY (table_name, entry_id)
+);
+
+-- tables whose dedupe_keys have been built
+CREATE TABLE IF NOT EXISTS dedupe_state (
+       table_name TEXT PRIMARY KEY,
+       built_at DATETIME
+);
@@ -8,6 +8,7 @@ import os
 import sys
 from datetime import datetime
 from pathlib import Path
+import typing as tp
 
 # Add the directory containing the main script to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -71,6 +72,41 @@ class BackupScheduler:
             print(f"Backup failed: {e}")
             return False
 
+    def run_maintenance(self, time_budget: tp.Optional[float] = None):
+        """Run database maintenance after the backups."""
+        try:
+            if not self.db_path.exists():
+                print(f"Database not found: {self.db_path}")
+                return False
+
+            db = DBManager(self.config)
+            report = db.maintain(time_budget)
+            db.close()
+
+            steps = ", ".join(f"{s['step']} {s['status']}" for s in report["steps"])
+            print(f"Maintenance finished: {steps}")
+            print(
+                f"Reclaimed {report['reclaimed'] / 1024:.2f} KB "
+                f"in {report['elapsed']:.3f} s"
+            )
+
+            log_entry = (
+                f"{datetime.now().isoformat()}: Maintenance - {steps}, "
+                f"integrity {', '.join(report['integrity'] or ['not checked'])}, "
+                f"reclaimed {report['reclaimed']} bytes in {report['elapsed']} s\n"
+            )
+            with open(self.backup_dir / "backup_log.txt", "a") as f:
+                f.write(log_entry)
+
+            return report["integrity"] in (None, ["ok"])
+
+        except Exception as e:
+            error_msg = f"{datetime.now().isoformat()}: Maintenance failed - {str(e)}\n"
+            with open(self.backup_dir / "backup_log.txt", "a") as f:
+                f.write(error_msg)
+            print(f"Maintenance failed: {e}")
+            return False
+
     def get_backup_status(self):
         """Get information about recent backups."""
         backup_files = list(self.backup_dir.glob("db_backup_*.sqlite"))
@@ -99,6 +135,14 @@ def main():
     parser = argparse.ArgumentParser(description="Personal Database Backup Scheduler")
     parser.add_argument("--backup", action="store_true", help="Create a backup now")
     parser.add_argument("--status", action="store_true", help="Show backup status")
+    parser.add_argument(
+        "--maintain",
+        action="store_true",
+        help="Run database maintenance (after the backup when both are given)",
+    )
+    parser.add_argument(
+        "--budget", type=float, help="Time budget in seconds for maintenance"
+    )
     parser.add_argument(
         "--max-backups", type=int, default=30, help="Maximum number of backups to keep"
     )
@@ -108,8 +152,12 @@ def main():
 
     scheduler = BackupScheduler(config, args.max_backups)
 
-    if args.backup:
-        success = scheduler.run_backup()
+    if args.backup or args.maintain:
+        success = True
+        if args.backup:
+            success = scheduler.run_backup()
+        if args.maintain and success:
+            success = scheduler.run_maintenance(args.budget)
         sys.exit(0 if success else 1)
     elif args.status:
         scheduler.get_backup_status()
@@ -1,11 +1,25 @@
-import json
 import argparse
 
 from db_manager import DBManager
+from output import OUTPUT_FORMATS
 
 import typing as tp
 
 
+def add_output_arguments(parser: argparse.ArgumentParser):
+    """Add output format and field projection options"""
+
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="table",
+        help="Output format (default: table)",
+    )
+    parser.add_argument(
+        "--fields", help="Comma separated list of columns to output, e.g. id,tag_name"
+    )
+
+
 def create_cli():
     """Create CLI"""
 
@@ -68,6 +82,7 @@ def create_cli():
     )
     search_parser.add_argument("pattern", help="Regex pattern to search for")
     search_parser.add_argument("--field", help="Specific field to search in")
+    add_output_arguments(search_parser)
 
     # Get command
     get_parser = subparsers.add_parser("get", help="Get entry by ID")
@@ -84,6 +99,7 @@ def create_cli():
         ],
     )
     get_parser.add_argument("id", help="Entry ID")
+    add_output_arguments(get_parser)
 
     # List command
     list_parser = subparsers.add_parser("list", help="List entries")
@@ -100,6 +116,7 @@ def create_cli():
         ],
     )
     list_parser.add_argument("--limit", type=int, help="Limit number of results")
+    add_output_arguments(list_parser)
 
     # Delete command
     delete_parser = subparsers.add_parser("delete", help="Delete an entry")
@@ -120,6 +137,45 @@ def create_cli():
     # Backup command
     subparsers.add_parser("backup", help="Create database backup")
 
+    # Maintain command
+    maintain_parser = subparsers.add_parser(
+        "maintain", help="Vacuum, analyze, optimize and check the database"
+    )
+    maintain_parser.add_argument(
+        "--budget", type=float, help="Time budget in seconds for maintenance"
+    )
+
+    # Dedupe command
+    dedupe_parser = subparsers.add_parser(
+        "dedupe", help="Find and merge duplicate persons or entities"
+    )
+    dedupe_parser.add_argument("table", choices=["persons", "entities"])
+    dedupe_parser.add_argument(
+        "--min-score",
+        type=float,
+        default=0.75,
+        help="Minimum similarity score of a candidate, 0 to 1 (default: 0.75)",
+    )
+    dedupe_parser.add_argument("--limit", type=int, help="Limit number of candidates")
+    dedupe_parser.add_argument(
+        "--merge",
+        nargs=2,
+        metavar=("KEEP_ID", "DROP_ID"),
+        help="Merge DROP_ID into KEEP_ID instead of listing candidates",
+    )
+    dedupe_parser.add_argument(
+        "--format",
+        choices=["table", "ndjson", "tsv"],
+        default="table",
+        help="Output format (default: table)",
+    )
+
+    # Stats command
+    stats_parser = subparsers.add_parser("stats", help="Show usage statistics")
+    stats_parser.add_argument(
+        "--top", type=int, default=5, help="Number of most updated entries to show"
+    )
+
     # Import command
     import_parser = subparsers.add_parser("import", help="Import from JSON")
     import_parser.add_argument(
@@ -135,6 +191,11 @@ def create_cli():
         ],
     )
     import_parser.add_argument("file", help="JSON file to import")
+    import_parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Insert or update by id, applying deletions from an exported changeset",
+    )
 
     # Export command
     export_parser = subparsers.add_parser("export", help="Export to JSON")
@@ -151,6 +212,10 @@ def create_cli():
         ],
     )
     export_parser.add_argument("file", help="Output JSON file")
+    export_parser.add_argument(
+        "--since",
+        help="Only export changes after this UTC timestamp or previous export token",
+    )
 
     return parser
 
@@ -214,25 +279,3 @@ def interactive_add(db: DBManager, table_name: str) -> tp.Dict[str, tp.Any]:
                 data[field] = value
 
     return data
-
-
-def format_output(data: tp.List[tp.Dict[str, tp.Any]]) -> str:
-    """Format output for display."""
-    if not data:
-        return "No entries found."
-
-    output = []
-    for entry in data:
-        output.append("=" * 50)
-        for key, value in entry.items():
-            if key == "update_history" and value:
-                try:
-                    history = json.loads(value)
-                    output.append(f"{key}: {len(history)} updates")
-                except:
-                    output.append(f"{key}: {value}")
-            else:
-                output.append(f"{key}: {value}")
-        output.append("")
-
-    return "\n".join(output)
@@ -1,16 +1,76 @@
+import functools
 import json
 import sqlite3
-import uuid
 import re
 import shutil
+import time
+import weakref
 
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 
 from dataclasses import dataclass
 import typing as tp
 
+from id_allocator import IDAllocator
+from snapshot import Snapshot
+
+# seconds a write may wait on a locked database before failing
+BUSY_TIMEOUT = 5.0
+
+# last_updated is stamped before the write commits, so a write can become
+# visible up to a lock wait after its timestamp; watermarks are moved back
+# by this much so such writes are picked up by the next export
+SYNC_MARGIN = timedelta(seconds=BUSY_TIMEOUT + 1)
+
+
+def utc_timestamp(moment: tp.Optional[datetime] = None) -> str:
+    """
+    UTC timestamp in the format of the last_updated column default
+    (millisecond precision), which keeps watermarks comparable as plain
+    strings.
+    """
+
+    moment = moment or datetime.now(timezone.utc)
+
+    return moment.strftime("%Y-%m-%d %H:%M:%S.") + f"{moment.microsecond // 1000:03d}"
+
+
+def _parse_watermark(since: str) -> str:
+    "Normalize a timestamp or export token to the last_updated format"
+
+    try:
+
+        moment = datetime.fromisoformat(since)
+
+    except ValueError:
+
+        raise ValueError("Invalid watermark: {}".format(since))
+
+    # naive timestamps are taken as UTC, like the stored values
+    if moment.tzinfo is not None:
+
+        moment = moment.astimezone(timezone.utc)
+
+    return utc_timestamp(moment)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(pattern: str) -> tp.Pattern:
+
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _regexp(pattern: str, value: tp.Any) -> bool:
+    "Implementation of the sqlite REGEXP operator, `value REGEXP pattern`"
+
+    if not value or not isinstance(value, str):
+
+        return False
+
+    return _compile(pattern).search(value) is not None
+
 
 @dataclass
 class DBConfig:
@@ -20,6 +80,8 @@ class DBConfig:
     backup_path: str
     schema_path: str
     prefix_path: str
+    id_scheme: str = "random"  # 'random' or 'time' (time ordered ids)
+    id_suffix_length: int = 8
 
 
 class DBManager:
@@ -31,10 +93,15 @@ class DBManager:
         self.backup_dir.mkdir(exist_ok=True)
         self.schema_path = config.schema_path
         self.prefix_path = config.prefix_path
+        self.id_scheme = config.id_scheme
+        self.id_suffix_length = config.id_suffix_length
 
         self.prefixes = None
         self.tables = None
         self.conn = None
+        self.id_allocator = None
+        self.columns: tp.Dict[str, tp.List[str]] = {}
+        self.snapshots: "weakref.WeakSet[Snapshot]" = weakref.WeakSet()
 
         self._get_schema()
         self._init_db()
@@ -57,11 +124,40 @@ class DBManager:
         Initialize database connection and create tables from schema if not exist
         """
 
-        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT)
         self.conn.row_factory = sqlite3.Row  # enable dictionary like access
+        self.conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+
+        # only takes effect on a new, empty database; existing ones are
+        # converted by maintain()
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
         # create tables
         self._create_tables()
+        self._migrate_last_updated()
+        self._create_stats_triggers()
+        self._create_sync_triggers()
+
+        self.id_allocator = IDAllocator(
+            self.conn,
+            self.prefixes,  # pyright: ignore
+            scheme=self.id_scheme,
+            suffix_length=self.id_suffix_length,
+        )
+
+    def _read_connection(self) -> sqlite3.Connection:
+        """
+        Separate read-only connection, for reads that need their own
+        transaction without touching the one open on self.conn
+        """
+
+        uri = self.db_path.resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(
+            uri, uri=True, timeout=BUSY_TIMEOUT, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+
+        return conn
 
     def _create_tables(self):
 
@@ -76,12 +172,188 @@ class DBManager:
 
         self.conn.commit()
 
+    def _migrate_last_updated(self):
+        """
+        Add the last_updated column to tables created before it existed and
+        index it for incremental export.
+        """
+
+        assert self.conn is not None, "Connection cannot be established"
+        assert self.tables is not None, "Tables must be loaded before migrating"
+
+        cursor = self.conn.cursor()
+
+        for table_name in self.tables:
+
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            columns = [row["name"] for row in cursor.fetchall()]
+
+            if "last_updated" in columns:
+                continue
+
+            # ALTER TABLE does not allow a non constant default
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN last_updated DATETIME")
+
+            # the backfill is not a user update, keep it out of entry_stats;
+            # _create_stats_triggers recreates the trigger afterwards
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_stats_update")
+
+            # same millisecond shape as the column default, so string
+            # comparisons against watermarks hold
+            cursor.execute(
+                f"UPDATE {table_name} "
+                "SET last_updated = strftime('%Y-%m-%d %H:%M:%f', date_added)"
+            )
+
+        for table_name in self.tables:
+
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table_name}_last_updated "
+                f"ON {table_name} (last_updated)"
+            )
+
+        self.conn.commit()
+
+    def _create_sync_triggers(self):
+        "Create the triggers that record tombstones for deleted entries"
+
+        assert self.conn is not None, "Connection cannot be established"
+        assert self.tables is not None, "Tables must be loaded before triggers"
+
+        cursor = self.conn.cursor()
+
+        for table_name in self.tables:
+
+            cursor.executescript(f"""
+                CREATE TRIGGER IF NOT EXISTS {table_name}_tombstone_delete
+                AFTER DELETE ON {table_name}
+                BEGIN
+                    INSERT OR REPLACE INTO deleted_entries (table_name, entry_id, deleted_at)
+                    VALUES ('{table_name}', OLD.id, strftime('%Y-%m-%d %H:%M:%f', 'now'));
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS {table_name}_tombstone_insert
+                AFTER INSERT ON {table_name}
+                BEGIN
+                    DELETE FROM deleted_entries
+                    WHERE table_name = '{table_name}' AND entry_id = NEW.id;
+                END;
+                """)
+
+        self.conn.commit()
+
+    def _create_stats_triggers(self):
+        """
+        Create the triggers that keep table_stats and entry_stats current,
+        and seed the counters of tables that have not been tracked yet.
+        """
+
+        assert self.conn is not None, "Connection cannot be established"
+        assert self.tables is not None, "Tables must be loaded before triggers"
+
+        cursor = self.conn.cursor()
+
+        cursor.execute("SELECT table_name FROM table_stats")
+        tracked = {row["table_name"] for row in cursor.fetchall()}
+
+        for table_name in self.tables:
+
+            cursor.executescript(f"""
+                CREATE TRIGGER IF NOT EXISTS {table_name}_stats_insert
+                AFTER INSERT ON {table_name}
+                BEGIN
+                    UPDATE table_stats
+                    SET row_count = row_count + 1, last_modified = CURRENT_TIMESTAMP
+                    WHERE table_name = '{table_name}';
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS {table_name}_stats_update
+                AFTER UPDATE ON {table_name}
+                BEGIN
+                    UPDATE table_stats
+                    SET last_modified = CURRENT_TIMESTAMP
+                    WHERE table_name = '{table_name}';
+
+                    INSERT INTO entry_stats (table_name, entry_id, update_count, last_updated)
+                    VALUES ('{table_name}', NEW.id, 1, CURRENT_TIMESTAMP)
+                    ON CONFLICT (table_name, entry_id) DO UPDATE
+                    SET update_count = update_count + 1,
+                        last_updated = excluded.last_updated;
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS {table_name}_stats_delete
+                AFTER DELETE ON {table_name}
+                BEGIN
+                    UPDATE table_stats
+                    SET row_count = row_count - 1, last_modified = CURRENT_TIMESTAMP
+                    WHERE table_name = '{table_name}';
+
+                    DELETE FROM entry_stats
+                    WHERE table_name = '{table_name}' AND entry_id = OLD.id;
+                END;
+                """)
+
+            if table_name in tracked:
+                continue
+
+            # one time scan for databases created before stats were tracked
+            cursor.execute(
+                f"""
+                INSERT INTO table_stats (table_name, row_count, last_modified)
+                SELECT ?, COUNT(*), MAX(date_added) FROM {table_name}
+                """,
+                (table_name,),
+            )
+            cursor.execute(
+                f"""
+                INSERT OR IGNORE INTO entry_stats (table_name, entry_id, update_count)
+                SELECT ?, id, json_array_length(update_history) - 1 FROM {table_name}
+                WHERE json_valid(update_history)
+                AND json_array_length(update_history) > 1
+                """,
+                (table_name,),
+            )
+
+        self.conn.commit()
+
     def _generate_id(self, table_name: str) -> str:
 
-        prefix = self.prefixes.get(table_name, "xx")  # pyright: ignore
-        unique_part = str(uuid.uuid4())[:8]
+        assert self.id_allocator is not None, "ID allocator was not initialized"
+
+        return self.id_allocator.allocate(table_name)[0]
+
+    def assign_ids(
+        self, table_name: str, entries: tp.List[tp.Dict[str, tp.Any]]
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """
+        Allocate ids in bulk for every entry that does not have one yet.
+        Entries that are not dicts are left for add_entry to reject.
+        """
+
+        # keeps linter happy
+        assert (
+            self.tables is not None
+        ), "self.tables cannot be None, initialization must have failed"
+
+        if table_name not in self.tables:
+
+            raise ValueError("Invalid table name: {}".format(table_name))
+
+        assert self.id_allocator is not None, "ID allocator was not initialized"
 
-        return f"{prefix}{unique_part}"
+        missing = [
+            entry for entry in entries if isinstance(entry, dict) and "id" not in entry
+        ]
+
+        if missing:
+
+            ids = self.id_allocator.allocate(table_name, len(missing))
+
+            for entry, entry_id in zip(missing, ids):
+
+                entry["id"] = entry_id
+
+        return entries
 
     def _update_history(self, current_history: tp.Optional[str]) -> str:
         "Add current timestamp to history"
@@ -120,6 +392,7 @@ class DBManager:
 
         # add update history
         data["update_history"] = self._update_history(None)
+        data["last_updated"] = utc_timestamp()
 
         # build sql
         columns = ", ".join(data.keys())
@@ -160,7 +433,7 @@ class DBManager:
 
         # update history
         data["update_history"] = self._update_history(result["update_history"])
-        data["last_updated"] = datetime.now().isoformat()
+        data["last_updated"] = utc_timestamp()
 
         # build sql
         set_clause = ", ".join(["{} = ?".format(k) for k in data.keys()])
@@ -171,10 +444,8 @@ class DBManager:
 
         return cursor.rowcount > 0
 
-    def search_entries(
-        self, table_name: str, pattern: str, field: tp.Optional[str] = None
-    ) -> tp.List[tp.Dict[str, tp.Any]]:
-        """Search entries using regrex pattern."""
+    def _table_columns(self, table_name: str) -> tp.List[str]:
+        "Column names of a table, in schema order"
 
         # keeps linter happy
         assert (
@@ -185,87 +456,143 @@ class DBManager:
 
             raise ValueError("Invalid table name: {}".format(table_name))
 
-        assert self.conn is not None, "Connection failure for search_entries"
+        if table_name not in self.columns:
 
-        cursor = self.conn.cursor()
+            assert self.conn is not None, "Connection failure for _table_columns"
+            cursor = self.conn.execute(f"PRAGMA table_info({table_name})")
+            self.columns[table_name] = [row["name"] for row in cursor.fetchall()]
 
-        if field:
+        return self.columns[table_name]
+
+    def _select_list(
+        self, table_name: str, fields: tp.Optional[tp.List[str]] = None
+    ) -> str:
+        "Validated column list for a SELECT, '*' when no projection is given"
+
+        columns = self._table_columns(table_name)
+
+        if not fields:
+
+            return "*"
+
+        for field in fields:
+
+            if field not in columns:
+
+                raise ValueError("Invalid field for {}: {}".format(table_name, field))
+
+        return ", ".join(fields)
+
+    def iter_search(
+        self,
+        table_name: str,
+        pattern: str,
+        field: tp.Optional[str] = None,
+        fields: tp.Optional[tp.List[str]] = None,
+    ) -> tp.Iterator[tp.Dict[str, tp.Any]]:
+        """
+        Yield entries matching a regex pattern, straight off the cursor.
+        Matching runs inside sqlite through the REGEXP function so only
+        the projected columns of matching rows are materialized.
+        """
 
-            cursor.execute(f"SELECT * FROM {table_name}")
-            results = cursor.fetchall()
-            filtered_results = []
+        # fail with the re.error message, sqlite would only report that the
+        # user-defined function raised an exception
+        _compile(pattern)
 
-            for row in results:
+        columns = self._table_columns(table_name)
+        select = self._select_list(table_name, fields)
 
-                if (
-                    field in row.keys()
-                    and row[field]
-                    and re.search(pattern, str(row[field]), re.IGNORECASE)
-                ):
+        if field:
+
+            if field not in columns:
 
-                    filtered_results.append(dict(row))
+                raise ValueError("Invalid field for {}: {}".format(table_name, field))
 
-            return filtered_results
+            where = f"CAST({field} AS TEXT) REGEXP ?"
+            params = [pattern]
 
         else:
 
             # search all text fields
-            cursor.execute(f"SELECT * FROM {table_name}")
-            results = cursor.fetchall()
-            filtered_results = []
+            where = " OR ".join([f"{column} REGEXP ?" for column in columns])
+            params = [pattern] * len(columns)
 
-            for row in results:
-
-                row_dict = dict(row)
+        assert self.conn is not None, "Connection failure for search_entries"
 
-                for value in row_dict.values():
+        cursor = self.conn.execute(
+            f"SELECT {select} FROM {table_name} WHERE {where}", params
+        )
 
-                    if (
-                        value
-                        and isinstance(value, str)
-                        and re.search(pattern, value, re.IGNORECASE)
-                    ):
+        for row in cursor:
 
-                        filtered_results.append(row_dict)
+            yield dict(row)
 
-                        break
+    def search_entries(
+        self,
+        table_name: str,
+        pattern: str,
+        field: tp.Optional[str] = None,
+        fields: tp.Optional[tp.List[str]] = None,
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """Search entries using regrex pattern."""
 
-            return filtered_results
+        return list(self.iter_search(table_name, pattern, field, fields))
 
     def get_entry_by_id(
-        self, table_name: str, entry_id: str
+        self,
+        table_name: str,
+        entry_id: str,
+        fields: tp.Optional[tp.List[str]] = None,
     ) -> tp.Optional[tp.Dict[str, tp.Any]]:
         """Get a specific entry by id."""
 
+        select = self._select_list(table_name, fields)
+
         assert (
             self.conn is not None
         ), "Issue with connection when calling get_entry_by_id"
         cursor = self.conn.cursor()
-        cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (entry_id,))
+        cursor.execute(f"SELECT {select} FROM {table_name} WHERE id = ?", (entry_id,))
         result = cursor.fetchone()
 
         return dict(result) if result else None
 
-    def list_entries(
-        self, table_name: str, limit: tp.Optional[int] = None
-    ) -> tp.List[tp.Dict[str, tp.Any]]:
-        """List all entries in a table"""
+    def iter_entries(
+        self,
+        table_name: str,
+        limit: tp.Optional[int] = None,
+        fields: tp.Optional[tp.List[str]] = None,
+    ) -> tp.Iterator[tp.Dict[str, tp.Any]]:
+        """Yield entries in a table, newest first, straight off the cursor"""
 
-        assert self.conn is not None, "Issue with connection when calling list_entries"
+        select = self._select_list(table_name, fields)
 
-        cursor = self.conn.cursor()
+        assert self.conn is not None, "Issue with connection when calling list_entries"
 
-        sql = f"SELECT * FROM {table_name} ORDER BY date_added DESC"
+        sql = f"SELECT {select} FROM {table_name} ORDER BY date_added DESC"
+        params = []
 
         if limit:
 
-            sql += f" LIMIT {limit}"
+            sql += " LIMIT ?"
+            params.append(limit)
 
-        cursor.execute(sql)
+        cursor = self.conn.execute(sql, params)
 
-        results = cursor.fetchall()
+        for row in cursor:
 
-        return [dict(row) for row in results]
+            yield dict(row)
+
+    def list_entries(
+        self,
+        table_name: str,
+        limit: tp.Optional[int] = None,
+        fields: tp.Optional[tp.List[str]] = None,
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """List all entries in a table"""
+
+        return list(self.iter_entries(table_name, limit, fields))
 
     def delete_entry(self, table_name: str, entry_id: str) -> bool:
         """Delete an entry by ID."""
@@ -279,6 +606,176 @@ class DBManager:
 
         return cursor.rowcount > 0
 
+    def get_stats(self, top: int = 5) -> tp.Dict[str, tp.Any]:
+        """
+        Usage statistics read from the trigger maintained summary tables:
+        row count and last modification per table, and the most updated
+        entries.
+        """
+
+        assert self.conn is not None, "Issue with connection when calling get_stats"
+
+        cursor = self.conn.cursor()
+
+        cursor.execute(
+            "SELECT table_name, row_count, last_modified FROM table_stats "
+            "ORDER BY table_name"
+        )
+        tables = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT table_name, entry_id, update_count, last_updated FROM entry_stats "
+            "ORDER BY update_count DESC LIMIT ?",
+            (top,),
+        )
+        most_updated = [dict(row) for row in cursor.fetchall()]
+
+        return {"tables": tables, "most_updated": most_updated}
+
+    def _file_size(self) -> tp.Tuple[int, int]:
+        "Size of the database in bytes and the number of free pages"
+
+        assert self.conn is not None, "Issue with connection when calling _file_size"
+
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return page_size * page_count, freelist
+
+    def maintain(
+        self, time_budget: tp.Optional[float] = None, vacuum_pages: int = 1000
+    ) -> tp.Dict[str, tp.Any]:
+        """
+        Run database maintenance: incremental vacuum (converting the file to
+        auto_vacuum=INCREMENTAL first if needed), ANALYZE, PRAGMA optimize and
+        an integrity check.
+
+        With a time budget (seconds) a running step is interrupted once the
+        budget is spent and the remaining steps are skipped.
+
+        Returns a report with the status and elapsed time of every step and
+        the space reclaimed.
+        """
+
+        assert self.conn is not None, "Issue with connection when calling maintain"
+        conn = self.conn
+
+        # VACUUM cannot run inside a transaction
+        conn.commit()
+
+        start = time.monotonic()
+        deadline = start + time_budget if time_budget is not None else None
+        size_before, _ = self._file_size()
+        reclaimed = 0
+        steps = []
+        integrity = None
+
+        def out_of_time() -> bool:
+
+            return deadline is not None and time.monotonic() >= deadline
+
+        def incremental_vacuum():
+
+            nonlocal reclaimed
+
+            try:
+
+                mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+                if mode != 2:
+
+                    # converting an existing database requires a full vacuum
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
+
+                while self._file_size()[1] > 0 and not out_of_time():
+
+                    conn.execute(
+                        f"PRAGMA incremental_vacuum({vacuum_pages})"
+                    ).fetchall()
+
+            finally:
+
+                # measured here since ANALYZE adds its statistics tables afterwards;
+                # converting to incremental adds a pointer map page, so a file
+                # without free pages can grow slightly
+                reclaimed = max(0, size_before - self._file_size()[0])
+
+        def analyze():
+
+            if deadline is not None:
+
+                # approximate statistics keep ANALYZE cheap on large tables
+                conn.execute("PRAGMA analysis_limit = 1000")
+
+            conn.execute("ANALYZE")
+
+        def optimize():
+
+            conn.execute("PRAGMA optimize")
+
+        def integrity_check():
+
+            nonlocal integrity
+
+            rows = conn.execute("PRAGMA integrity_check").fetchall()
+            integrity = [row[0] for row in rows]
+
+        conn.set_progress_handler(lambda: 1 if out_of_time() else 0, 10000)
+
+        try:
+
+            for name, step in [
+                ("incremental_vacuum", incremental_vacuum),
+                ("analyze", analyze),
+                ("optimize", optimize),
+                ("integrity_check", integrity_check),
+            ]:
+
+                if out_of_time():
+
+                    steps.append({"step": name, "status": "skipped", "elapsed": 0.0})
+                    continue
+
+                step_start = time.monotonic()
+
+                try:
+
+                    step()
+                    status = "done"
+
+                except sqlite3.OperationalError as e:
+
+                    if "interrupted" not in str(e):
+                        raise
+
+                    status = "interrupted"
+
+                steps.append(
+                    {
+                        "step": name,
+                        "status": status,
+                        "elapsed": round(time.monotonic() - step_start, 3),
+                    }
+                )
+
+        finally:
+
+            conn.set_progress_handler(None, 0)
+            conn.commit()
+
+        size_after, _ = self._file_size()
+
+        return {
+            "steps": steps,
+            "integrity": integrity,
+            "size_before": size_before,
+            "size_after": size_after,
+            "reclaimed": reclaimed,
+            "elapsed": round(time.monotonic() - start, 3),
+        }
+
     def backup_database(self) -> str:
         """Create a backup for database"""
 
@@ -298,11 +795,14 @@ class DBManager:
 
         count = 0
 
+        self.assign_ids(table_name, data)
+
         for entry in data:
 
             try:
 
                 self.add_entry(table_name, entry)
+                count += 1
 
             except Exception as e:
 
@@ -320,8 +820,155 @@ class DBManager:
 
         return len(entries)
 
+    def export_changes(
+        self, table_name: str, since: str, output_file: str
+    ) -> tp.Dict[str, tp.Any]:
+        """
+        Export entries added, updated or deleted after a watermark as a
+        changeset. The returned watermark is the token for the next export.
+        The watermark trails the export by SYNC_MARGIN, so the next export
+        repeats recent changes; that is harmless for an upsert import.
+        """
+
+        columns = self._table_columns(table_name)
+        since = _parse_watermark(since)
+
+        # read everything from one snapshot, on a separate connection so an
+        # open transaction of the caller is neither committed nor exported
+        conn = self._read_connection()
+
+        try:
+
+            conn.execute("BEGIN")
+            conn.execute(f"SELECT 1 FROM {table_name} LIMIT 1")
+            watermark = utc_timestamp(datetime.now(timezone.utc) - SYNC_MARGIN)
+
+            cursor = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table_name} "
+                "WHERE last_updated >= ? ORDER BY last_updated",
+                (since,),
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+
+            cursor = conn.execute(
+                "SELECT entry_id AS id, deleted_at FROM deleted_entries "
+                "WHERE table_name = ? AND deleted_at >= ? ORDER BY deleted_at",
+                (table_name, since),
+            )
+            deleted = [dict(row) for row in cursor.fetchall()]
+
+        finally:
+
+            conn.close()
+
+        changeset = {
+            "table": table_name,
+            "since": since,
+            "watermark": watermark,
+            "rows": rows,
+            "deleted": deleted,
+        }
+
+        with open(output_file, "w") as f:
+
+            json.dump(changeset, f, indent=2, default=str)
+
+        return {"rows": len(rows), "deleted": len(deleted), "watermark": watermark}
+
+    def upsert_from_json(self, table_name: str, json_file: str) -> tp.Dict[str, int]:
+        """
+        Apply a changeset from export_changes, or a plain list of entries, in
+        one transaction. Existing ids are updated in place, new ones inserted
+        and tombstoned ids deleted.
+        """
+
+        with open(json_file, "r") as f:
+
+            data = json.load(f)
+
+        if isinstance(data, list):
+
+            data = {"rows": data, "deleted": []}
+
+        if data.get("table", table_name) != table_name:
+
+            raise ValueError(
+                "Changeset is for table {}, not {}".format(data["table"], table_name)
+            )
+
+        columns = self._table_columns(table_name)
+        rows = self.assign_ids(table_name, data.get("rows", []))
+
+        for row in rows:
+
+            for key in row:
+
+                if key not in columns:
+
+                    raise ValueError("Invalid field for {}: {}".format(table_name, key))
+
+        assert (
+            self.conn is not None
+        ), "Issue with connection when calling upsert_from_json"
+
+        with self.conn:
+
+            cursor = self.conn.cursor()
+
+            cursor.executemany(
+                f"DELETE FROM {table_name} WHERE id = ?",
+                [(entry["id"],) for entry in data.get("deleted", [])],
+            )
+            deleted = cursor.rowcount if data.get("deleted") else 0
+
+            for row in rows:
+
+                keys = list(row.keys())
+                updates = ", ".join([f"{k} = excluded.{k}" for k in keys if k != "id"])
+                sql = "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT (id) DO {}".format(
+                    table_name,
+                    ", ".join(keys),
+                    ", ".join(["?" for _ in keys]),
+                    f"UPDATE SET {updates}" if updates else "NOTHING",
+                )
+                cursor.execute(sql, list(row.values()))
+
+        return {"upserted": len(rows), "deleted": deleted}
+
+    def snapshot(
+        self,
+        tables: tp.Optional[tp.List[str]] = None,
+        auto_refresh: tp.Optional[float] = None,
+    ) -> Snapshot:
+        """
+        Load tables (tags and signatures by default) into a read-only
+        in-memory snapshot for repeated lookups.
+
+        Without auto_refresh the snapshot keeps the rows it loaded until
+        refresh() is called, keeping it current is up to the caller. With
+        auto_refresh, lookups reload it when the database changed, checking
+        at most once per auto_refresh seconds. Open snapshots are closed
+        with the DBManager.
+        """
+
+        tables = tables or ["tags", "signatures"]
+
+        for table_name in tables:
+
+            # validates the table name
+            self._table_columns(table_name)
+
+        snapshot = Snapshot(self._read_connection(), tables, auto_refresh)
+        self.snapshots.add(snapshot)
+
+        return snapshot
+
     def close(self):
-        """Close database connection."""
+        """Close database connection and the connections of open snapshots."""
+
+        for snapshot in list(self.snapshots):
+
+            snapshot.close()
 
         if self.conn:
             self.conn.close()
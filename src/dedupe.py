@@ -0,0 +1,543 @@
+import re
+import json
+import difflib
+import itertools
+import unicodedata
+
+import typing as tp
+
+from db_manager import DBManager, utc_timestamp
+from id_allocator import MAX_PARAMS
+
+DEDUPE_TABLES = ("persons", "entities")
+
+# words that do not distinguish one entity name from another
+ENTITY_STOPWORDS = {"the", "inc", "llc", "ltd", "co", "corp", "company", "gmbh", "and"}
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+
+def normalize(value: tp.Optional[str]) -> str:
+    "Lowercase, strip accents and replace punctuation with spaces"
+
+    if not value:
+
+        return ""
+
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", value.lower()).split())
+
+
+def soundex(word: str) -> str:
+    "American soundex code of a normalized word"
+
+    letters = [c for c in word if c.isalpha()]
+
+    if not letters:
+
+        return ""
+
+    code = letters[0].upper()
+    last = SOUNDEX_CODES.get(letters[0], "")
+
+    for c in letters[1:]:
+
+        digit = SOUNDEX_CODES.get(c, "")
+
+        if digit and digit != last:
+
+            code += digit
+
+        # h and w do not separate letters with the same code
+        if c not in "hw":
+
+            last = digit
+
+    return (code + "000")[:4]
+
+
+def normalize_email(address: str) -> str:
+    "Lowercase and drop +tags, and dots for gmail addresses"
+
+    local, _, domain = address.strip().lower().partition("@")
+    local = local.split("+", 1)[0]
+
+    if domain in ("gmail.com", "googlemail.com"):
+
+        local = local.replace(".", "")
+        domain = "gmail.com"
+
+    return f"{local}@{domain}"
+
+
+def normalize_phone(number: str, country_code: tp.Any = 1) -> str:
+
+    digits = re.sub(r"\D", "", str(number))
+
+    return f"{country_code or ''}-{digits[-10:]}"
+
+
+class DedupeEngine:
+    """
+    Find near duplicate persons and entities.
+
+    Every entry gets a few normalized blocking keys (sorted name tokens,
+    soundex codes, normalized emails and phone numbers of the entries it
+    owns) stored in dedupe_keys. Entries are only compared with entries
+    sharing a key, so the cost grows with block sizes instead of the
+    square of the table size. After the first build, triggers mark the
+    entries touched by writes and only those keys are recomputed.
+    """
+
+    def __init__(self, db: DBManager, max_block_size: int = 50):
+
+        assert db.conn is not None, "DBManager must be connected"
+
+        self.db = db
+        self.conn = db.conn
+        self.max_block_size = max_block_size
+
+    def _check_table(self, table_name: str):
+
+        if table_name not in DEDUPE_TABLES:
+
+            raise ValueError("Dedupe is not supported for table: {}".format(table_name))
+
+    def _name(self, table_name: str, row: tp.Dict[str, tp.Any]) -> str:
+        "Normalized name used for comparison, tokens sorted"
+
+        if table_name == "persons":
+
+            parts = [
+                row.get("first_name"),
+                row.get("middle_name"),
+                row.get("last_name"),
+            ]
+
+        else:
+
+            parts = [row.get("entity_name")]
+
+        tokens = normalize(" ".join(p for p in parts if p)).split()
+
+        if table_name == "entities":
+
+            tokens = [t for t in tokens if t not in ENTITY_STOPWORDS] or tokens
+
+        return " ".join(sorted(tokens))
+
+    def _name_keys(self, table_name: str, row: tp.Dict[str, tp.Any]) -> tp.Set[str]:
+
+        keys = set()
+
+        if table_name == "persons":
+
+            last = normalize(row.get("last_name"))
+            firsts = [
+                normalize(row.get("first_name")),
+                normalize(row.get("preferred_name")),
+            ]
+
+            for first in filter(None, firsts):
+
+                keys.add("name:" + " ".join(sorted([first, last])))
+                keys.add(f"sx:{soundex(last.replace(' ', ''))}:{first[0]}")
+
+                if row.get("date_of_birth"):
+
+                    keys.add(f"dob:{row['date_of_birth']}:{first[0]}")
+
+        else:
+
+            for name in filter(
+                None, [row.get("entity_name"), row.get("preferred_name")]
+            ):
+
+                tokens = [
+                    t for t in normalize(name).split() if t not in ENTITY_STOPWORDS
+                ]
+
+                if tokens:
+
+                    keys.add("name:" + " ".join(sorted(tokens)))
+                    keys.add("sx:" + "-".join(sorted(soundex(t) for t in tokens)))
+
+        return keys
+
+    def _contact_keys(
+        self, owners: tp.Optional[tp.List[str]] = None
+    ) -> tp.Dict[str, tp.Set[str]]:
+        "Blocking keys of the emails and phone numbers, by owner id"
+
+        keys: tp.Dict[str, tp.Set[str]] = {}
+        chunks = [None] if owners is None else self._chunks(owners)
+
+        for chunk in chunks:
+
+            where = ""
+
+            if chunk is not None:
+
+                where = f" WHERE owner IN ({', '.join(['?' for _ in chunk])})"
+
+            for row in self.conn.execute(
+                "SELECT owner, email_address FROM emails" + where, chunk or []
+            ):
+
+                keys.setdefault(row["owner"], set()).add(
+                    "email:" + normalize_email(row["email_address"])
+                )
+
+            for row in self.conn.execute(
+                "SELECT owner, phone_number, country_code FROM phone_numbers" + where,
+                chunk or [],
+            ):
+
+                keys.setdefault(row["owner"], set()).add(
+                    "phone:" + normalize_phone(row["phone_number"], row["country_code"])
+                )
+
+        return keys
+
+    def _entry_keys(
+        self,
+        table_name: str,
+        rows: tp.Iterable[tp.Dict[str, tp.Any]],
+        contacts: tp.Dict[str, tp.Set[str]],
+    ) -> tp.List[tp.Tuple[str, str, str]]:
+
+        keys = []
+
+        for row in rows:
+
+            entry_keys = self._name_keys(table_name, row) | contacts.get(
+                row["id"], set()
+            )
+            keys.extend((table_name, key, row["id"]) for key in entry_keys)
+
+        return keys
+
+    def _create_triggers(self):
+        """
+        Create the triggers that mark entries whose keys need refreshing:
+        the entry itself on any write, and the owners of changed emails and
+        phone numbers.
+        """
+
+        def mark(table_name: str, ref: str) -> str:
+
+            return f"INSERT OR IGNORE INTO dedupe_dirty VALUES ('{table_name}', {ref});"
+
+        triggers = []
+
+        for table_name in DEDUPE_TABLES:
+
+            triggers += [
+                (table_name, "insert", mark(table_name, "NEW.id")),
+                (
+                    table_name,
+                    "update",
+                    mark(table_name, "OLD.id") + mark(table_name, "NEW.id"),
+                ),
+                (table_name, "delete", mark(table_name, "OLD.id")),
+            ]
+
+        for contact_table in ("emails", "phone_numbers"):
+
+            # owners may be persons or entities, mark the id in both
+            old = "".join(mark(t, "OLD.owner") for t in DEDUPE_TABLES)
+            new = "".join(mark(t, "NEW.owner") for t in DEDUPE_TABLES)
+
+            triggers += [
+                (contact_table, "insert", new),
+                (contact_table, "update", old + new),
+                (contact_table, "delete", old),
+            ]
+
+        # one statement per execute, executescript would commit the caller's
+        # open transaction
+        for table_name, event, body in triggers:
+
+            self.conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_name}_dedupe_{event} "
+                f"AFTER {event.upper()} ON {table_name} BEGIN {body} END"
+            )
+
+    def build_keys(self, table_name: str) -> int:
+        """
+        Recompute all blocking keys of a table, returns the number of keys.
+        Later writes are tracked by triggers, see refresh_keys.
+        """
+
+        self._check_table(table_name)
+
+        self._create_triggers()
+
+        with self.conn:
+
+            contacts = self._contact_keys()
+            keys = self._entry_keys(
+                table_name, self.db.iter_entries(table_name), contacts
+            )
+
+            self.conn.execute(
+                "DELETE FROM dedupe_keys WHERE table_name = ?", (table_name,)
+            )
+            self.conn.execute(
+                "DELETE FROM dedupe_dirty WHERE table_name = ?", (table_name,)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO dedupe_keys (table_name, block_key, entry_id) "
+                "VALUES (?, ?, ?)",
+                keys,
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dedupe_state (table_name, built_at) "
+                "VALUES (?, ?)",
+                (table_name, utc_timestamp()),
+            )
+
+        return len(keys)
+
+    def refresh_keys(self, table_name: str) -> int:
+        """
+        Bring the stored keys up to date: a full build the first time, after
+        that only the entries marked dirty since the last refresh. Returns
+        the number of keys written.
+        """
+
+        self._check_table(table_name)
+
+        built = self.conn.execute(
+            "SELECT 1 FROM dedupe_state WHERE table_name = ?", (table_name,)
+        ).fetchone()
+
+        if not built:
+
+            return self.build_keys(table_name)
+
+        with self.conn:
+
+            dirty = [
+                row["entry_id"]
+                for row in self.conn.execute(
+                    "SELECT entry_id FROM dedupe_dirty WHERE table_name = ?",
+                    (table_name,),
+                )
+            ]
+
+            if not dirty:
+
+                return 0
+
+            rows = self._fetch(table_name, dirty)
+            keys = self._entry_keys(
+                table_name, rows.values(), self._contact_keys(list(rows))
+            )
+
+            for chunk in self._chunks(dirty):
+
+                placeholders = ", ".join(["?" for _ in chunk])
+
+                for state_table in ("dedupe_keys", "dedupe_dirty"):
+
+                    self.conn.execute(
+                        f"DELETE FROM {state_table} WHERE table_name = ? "
+                        f"AND entry_id IN ({placeholders})",
+                        [table_name] + chunk,
+                    )
+
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO dedupe_keys (table_name, block_key, entry_id) "
+                "VALUES (?, ?, ?)",
+                keys,
+            )
+
+        return len(keys)
+
+    def _chunks(self, ids: tp.List[str]) -> tp.List[tp.List[str]]:
+
+        return [ids[i : i + MAX_PARAMS] for i in range(0, len(ids), MAX_PARAMS)]
+
+    def _fetch(self, table_name: str, ids: tp.List[str]) -> tp.Dict[str, tp.Dict]:
+
+        rows = {}
+
+        for chunk in self._chunks(ids):
+
+            placeholders = ", ".join(["?" for _ in chunk])
+            cursor = self.conn.execute(
+                f"SELECT * FROM {table_name} WHERE id IN ({placeholders})", chunk
+            )
+            rows.update((row["id"], dict(row)) for row in cursor)
+
+        return rows
+
+    def _score(
+        self,
+        table_name: str,
+        a: tp.Dict[str, tp.Any],
+        b: tp.Dict[str, tp.Any],
+        shared: tp.Set[str],
+    ) -> float:
+
+        score = difflib.SequenceMatcher(
+            None, self._name(table_name, a), self._name(table_name, b)
+        ).ratio()
+
+        if any(key.startswith(("email:", "phone:")) for key in shared):
+
+            score += 0.3
+
+        if table_name == "persons" and a["date_of_birth"] and b["date_of_birth"]:
+
+            score += 0.2 if a["date_of_birth"] == b["date_of_birth"] else -0.5
+
+        return round(max(0.0, min(1.0, score)), 3)
+
+    def find_candidates(
+        self, table_name: str, min_score: float = 0.75, limit: tp.Optional[int] = None
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """
+        Refresh the stored blocking keys and return merge candidates ranked
+        by score. Blocks larger than max_block_size are too common to be
+        informative and are skipped.
+        """
+
+        self.refresh_keys(table_name)
+
+        pairs: tp.Dict[tp.Tuple[str, str], tp.Set[str]] = {}
+
+        cursor = self.conn.execute(
+            "SELECT block_key, group_concat(entry_id, ' ') AS ids FROM dedupe_keys "
+            "WHERE table_name = ? GROUP BY block_key HAVING COUNT(*) BETWEEN 2 AND ?",
+            (table_name, self.max_block_size),
+        )
+
+        for row in cursor:
+
+            for pair in itertools.combinations(sorted(row["ids"].split()), 2):
+
+                pairs.setdefault(pair, set()).add(row["block_key"])
+
+        rows = self._fetch(table_name, sorted({i for pair in pairs for i in pair}))
+        candidates = []
+
+        for (id_a, id_b), shared in pairs.items():
+
+            a, b = rows[id_a], rows[id_b]
+            score = self._score(table_name, a, b, shared)
+
+            if score >= min_score:
+
+                candidates.append(
+                    {
+                        "score": score,
+                        "id_a": id_a,
+                        "name_a": self._name(table_name, a),
+                        "id_b": id_b,
+                        "name_b": self._name(table_name, b),
+                        "shared_keys": ", ".join(sorted(shared)),
+                    }
+                )
+
+        candidates.sort(key=lambda c: c["score"], reverse=True)
+
+        return candidates[:limit] if limit else candidates
+
+    def _repoint_occupants(self, keep_id: str, drop_id: str, now: str) -> int:
+        """
+        Replace drop_id with keep_id in the occupant lists of addresses.
+        Only exact list elements are replaced; lists that are not valid json
+        are left as they are. Returns the number of addresses changed.
+        """
+
+        cursor = self.conn.execute(
+            "SELECT id, current_occupants, past_occupants FROM addresses "
+            "WHERE instr(current_occupants, ?1) OR instr(past_occupants, ?1)",
+            (drop_id,),
+        )
+        changed = 0
+
+        for row in cursor.fetchall():
+
+            updates = {}
+
+            for field in ("current_occupants", "past_occupants"):
+
+                try:
+
+                    occupants = json.loads(row[field]) if row[field] else None
+
+                except ValueError:
+
+                    continue
+
+                if not isinstance(occupants, list) or drop_id not in occupants:
+                    continue
+
+                repointed = [keep_id if o == drop_id else o for o in occupants]
+
+                # keep_id may already have been listed
+                updates[field] = json.dumps(list(dict.fromkeys(repointed)))
+
+            if updates:
+
+                set_clause = ", ".join(f"{field} = ?" for field in updates)
+                self.conn.execute(
+                    f"UPDATE addresses SET {set_clause}, last_updated = ? WHERE id = ?",
+                    list(updates.values()) + [now, row["id"]],
+                )
+                changed += 1
+
+        return changed
+
+    def merge(self, table_name: str, keep_id: str, drop_id: str) -> tp.Dict[str, int]:
+        """
+        Merge drop_id into keep_id: emails, phone numbers and address
+        occupants pointing at drop_id are repointed to keep_id, then drop_id
+        is deleted. Runs in one transaction.
+        """
+
+        self._check_table(table_name)
+
+        if keep_id == drop_id:
+
+            raise ValueError("Cannot merge an entry into itself")
+
+        for entry_id in (keep_id, drop_id):
+
+            if self.db.get_entry_by_id(table_name, entry_id, ["id"]) is None:
+
+                raise ValueError(
+                    "Entry {} not found in {}".format(entry_id, table_name)
+                )
+
+        now = utc_timestamp()
+        counts = {}
+
+        with self.conn:
+
+            for contact_table in ("emails", "phone_numbers"):
+
+                cursor = self.conn.execute(
+                    f"UPDATE {contact_table} SET owner = ?, last_updated = ? "
+                    "WHERE owner = ?",
+                    (keep_id, now, drop_id),
+                )
+                counts[contact_table] = cursor.rowcount
+
+            counts["addresses"] = self._repoint_occupants(keep_id, drop_id, now)
+
+            self.conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (drop_id,))
+
+        return counts
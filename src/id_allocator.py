@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import time
+
+import typing as tp
+
+# SQLite limits the number of bound parameters per statement (999 on older builds)
+MAX_PARAMS = 900
+
+ID_SCHEMES = ("random", "time")
+
+
+class IDAllocator:
+    """
+    Allocate collision free ids for a table.
+
+    Candidates are generated in bulk and checked against the primary key
+    index with a single query per chunk; conflicting candidates are
+    regenerated until every id is unique or ``max_attempts`` is reached.
+
+    Schemes:
+        random: ``suffix_length`` random hex characters after the prefix
+        time: 12 hex characters of milliseconds since epoch followed by
+              ``suffix_length`` random hex characters, so new ids are
+              appended to the right edge of the primary key b-tree
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        prefixes: tp.Dict[str, str],
+        scheme: str = "random",
+        suffix_length: int = 8,
+        max_attempts: int = 10,
+    ):
+
+        if scheme not in ID_SCHEMES:
+
+            raise ValueError("Invalid id scheme: {}".format(scheme))
+
+        if suffix_length < 1:
+
+            raise ValueError("suffix_length must be positive")
+
+        self.conn = conn
+        self.prefixes = prefixes
+        self.scheme = scheme
+        self.suffix_length = suffix_length
+        self.max_attempts = max_attempts
+
+    def _random_hex(self) -> str:
+
+        return os.urandom((self.suffix_length + 1) // 2).hex()[: self.suffix_length]
+
+    def _candidate(self, prefix: str) -> str:
+
+        if self.scheme == "time":
+
+            millis = time.time_ns() // 1_000_000
+
+            return f"{prefix}{millis:012x}{self._random_hex()}"
+
+        return f"{prefix}{self._random_hex()}"
+
+    def _existing(self, table_name: str, candidates: tp.List[str]) -> tp.Set[str]:
+        "Return the candidates that are already present in the table"
+
+        existing = set()
+        cursor = self.conn.cursor()
+
+        for start in range(0, len(candidates), MAX_PARAMS):
+
+            chunk = candidates[start : start + MAX_PARAMS]
+            placeholders = ", ".join(["?" for _ in chunk])
+            cursor.execute(
+                f"SELECT id FROM {table_name} WHERE id IN ({placeholders})", chunk
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+
+        return existing
+
+    def allocate(self, table_name: str, count: int = 1) -> tp.List[str]:
+        """
+        Allocate ``count`` ids that neither exist in the table nor repeat
+        within the batch.
+        """
+
+        prefix = self.prefixes.get(table_name, "xx")
+
+        allocated: tp.List[str] = []
+        seen: tp.Set[str] = set()
+        needed = count
+
+        for _ in range(self.max_attempts):
+
+            if needed == 0:
+                break
+
+            candidates = []
+
+            for _ in range(needed):
+
+                candidate = self._candidate(prefix)
+
+                if candidate not in seen:
+
+                    seen.add(candidate)
+                    candidates.append(candidate)
+
+            taken = self._existing(table_name, candidates)
+            fresh = [c for c in candidates if c not in taken]
+
+            allocated.extend(fresh)
+            needed = count - len(allocated)
+
+        if needed:
+
+            raise RuntimeError(
+                "Could not allocate {} unique ids for {} after {} attempts".format(
+                    needed, table_name, self.max_attempts
+                )
+            )
+
+        return allocated
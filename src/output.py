@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import itertools
+
+import typing as tp
+
+OUTPUT_FORMATS = ("table", "ndjson", "tsv", "ids")
+
+# number of leading rows used to size the table columns before streaming
+TABLE_SAMPLE_ROWS = 50
+
+
+def _history_count(value: str) -> str:
+    "Count the timestamps of an update_history list without decoding it"
+
+    if value in ("", "[]"):
+
+        return "0 updates"
+
+    # not a json list, show it as stored like the old formatter did
+    if not value.startswith("["):
+
+        return value
+
+    return f"{value.count(',') + 1} updates"
+
+
+def _display(key: str, value: tp.Any) -> str:
+
+    if value is None:
+
+        return ""
+
+    if key == "update_history" and isinstance(value, str):
+
+        return _history_count(value)
+
+    return str(value).replace("\n", " ")
+
+
+def iter_table(rows: tp.Iterable[tp.Dict[str, tp.Any]]) -> tp.Iterator[str]:
+    """
+    Yield column aligned lines. Widths are taken from the first
+    TABLE_SAMPLE_ROWS rows, later rows are streamed as they arrive and
+    may overflow their column.
+    """
+
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, TABLE_SAMPLE_ROWS))
+
+    if not sample:
+
+        return
+
+    keys = list(sample[0].keys())
+    widths = {key: len(key) for key in keys}
+
+    for row in sample:
+
+        for key in keys:
+
+            widths[key] = max(widths[key], len(_display(key, row[key])))
+
+    def line(values: tp.Dict[str, str]) -> str:
+
+        return "  ".join(values[key].ljust(widths[key]) for key in keys).rstrip()
+
+    yield line({key: key for key in keys})
+    yield line({key: "-" * widths[key] for key in keys})
+
+    for row in itertools.chain(sample, rows):
+
+        yield line({key: _display(key, row[key]) for key in keys})
+
+
+def iter_ndjson(rows: tp.Iterable[tp.Dict[str, tp.Any]]) -> tp.Iterator[str]:
+    "Yield one json object per line"
+
+    for row in rows:
+
+        yield json.dumps(row, default=str)
+
+
+def _tsv_value(value: tp.Any) -> str:
+
+    if value is None:
+
+        return ""
+
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def iter_tsv(rows: tp.Iterable[tp.Dict[str, tp.Any]]) -> tp.Iterator[str]:
+    "Yield a header line followed by tab separated rows"
+
+    header = False
+
+    for row in rows:
+
+        if not header:
+
+            yield "\t".join(row.keys())
+            header = True
+
+        yield "\t".join(_tsv_value(value) for value in row.values())
+
+
+def iter_ids(rows: tp.Iterable[tp.Dict[str, tp.Any]]) -> tp.Iterator[str]:
+    "Yield only the id of each row"
+
+    for row in rows:
+
+        yield str(row["id"])
+
+
+FORMATTERS = {
+    "table": iter_table,
+    "ndjson": iter_ndjson,
+    "tsv": iter_tsv,
+    "ids": iter_ids,
+}
+
+
+def projection(
+    output_format: str, fields: tp.Optional[str] = None
+) -> tp.Optional[tp.List[str]]:
+    """
+    Columns to select for an output format, parsed from a comma separated
+    --fields value. None selects every column.
+    """
+
+    if output_format == "ids":
+
+        return ["id"]
+
+    if not fields:
+
+        return None
+
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def write_output(
+    rows: tp.Iterable[tp.Dict[str, tp.Any]],
+    output_format: str = "table",
+    stream: tp.Optional[tp.TextIO] = None,
+) -> int:
+    """
+    Write rows to the stream (stdout by default) as they are produced,
+    returns the row count. Stops quietly when stdout is a pipe that was
+    closed by the reader, e.g. `| head`.
+    """
+
+    if stream is None:
+
+        stream = sys.stdout
+
+    if output_format not in FORMATTERS:
+
+        raise ValueError("Invalid output format: {}".format(output_format))
+
+    count = 0
+
+    def counted() -> tp.Iterator[tp.Dict[str, tp.Any]]:
+
+        nonlocal count
+
+        for row in rows:
+
+            count += 1
+            yield row
+
+    try:
+
+        for line in FORMATTERS[output_format](counted()):
+
+            stream.write(line)
+            stream.write("\n")
+
+        if count == 0 and output_format == "table":
+
+            stream.write("No entries found.\n")
+
+        stream.flush()
+
+    except BrokenPipeError:
+
+        if stream is not sys.stdout:
+            raise
+
+        # send anything still buffered, and later prints, to /dev/null so
+        # the interpreter does not fail again when flushing stdout at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+    return count
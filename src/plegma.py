@@ -6,8 +6,10 @@ import json
 from pathlib import Path
 
 
-from cli import create_cli, interactive_add, format_output
+from cli import create_cli, interactive_add
 from db_manager import DBManager, DBConfig
+from dedupe import DedupeEngine
+from output import projection, write_output
 
 CWD = os.getcwd()
 
@@ -52,6 +54,8 @@ def main():
                     )
                     return
 
+                db.assign_ids(args.table, data)
+
                 entry_ids = []
                 for entry in data:
                     try:
@@ -85,19 +89,22 @@ def main():
             print(f"{'Updated' if success else 'Failed to update'} entry {args.id}")
 
         elif args.command == "search":
-            results = db.search_entries(args.table, args.pattern, args.field)
-            print(format_output(results))
+            fields = projection(args.format, args.fields)
+            results = db.iter_search(args.table, args.pattern, args.field, fields)
+            write_output(results, args.format)
 
         elif args.command == "get":
-            result = db.get_entry_by_id(args.table, args.id)
+            fields = projection(args.format, args.fields)
+            result = db.get_entry_by_id(args.table, args.id, fields)
             if result:
-                print(format_output([result]))
+                write_output([result], args.format)
             else:
                 print(f"Entry {args.id} not found")
 
         elif args.command == "list":
-            results = db.list_entries(args.table, args.limit)
-            print(format_output(results))
+            fields = projection(args.format, args.fields)
+            results = db.iter_entries(args.table, args.limit, fields)
+            write_output(results, args.format)
 
         elif args.command == "delete":
             success = db.delete_entry(args.table, args.id)
@@ -107,13 +114,54 @@ def main():
             backup_path = db.backup_database()
             print(f"Backup created: {backup_path}")
 
+        elif args.command == "maintain":
+            report = db.maintain(args.budget)
+            write_output(report["steps"])
+            print(f"\nIntegrity: {', '.join(report['integrity'] or ['not checked'])}")
+            print(f"Reclaimed: {report['reclaimed'] / 1024:.2f} KB")
+            print(f"Elapsed: {report['elapsed']:.3f} s")
+
+        elif args.command == "dedupe":
+            engine = DedupeEngine(db)
+            if args.merge:
+                keep_id, drop_id = args.merge
+                counts = engine.merge(args.table, keep_id, drop_id)
+                moved = ", ".join(f"{n} {table}" for table, n in counts.items())
+                print(f"Merged {drop_id} into {keep_id}, repointed {moved}")
+            else:
+                candidates = engine.find_candidates(
+                    args.table, args.min_score, args.limit
+                )
+                write_output(candidates, args.format)
+
+        elif args.command == "stats":
+            stats = db.get_stats(args.top)
+            write_output(stats["tables"])
+            print("\nMost updated entries:")
+            write_output(stats["most_updated"])
+
         elif args.command == "import":
-            count = db.import_from_json(args.table, args.file)
-            print(f"Imported {count} entries")
+            if args.upsert:
+                result = db.upsert_from_json(args.table, args.file)
+                print(
+                    f"Upserted {result['upserted']} entries, "
+                    f"deleted {result['deleted']} entries"
+                )
+            else:
+                count = db.import_from_json(args.table, args.file)
+                print(f"Imported {count} entries")
 
         elif args.command == "export":
-            count = db.export_to_json(args.table, args.file)
-            print(f"Exported {count} entries to {args.file}")
+            if args.since:
+                result = db.export_changes(args.table, args.since, args.file)
+                print(
+                    f"Exported {result['rows']} changed and {result['deleted']} "
+                    f"deleted entries to {args.file}"
+                )
+                print(f"Next watermark: {result['watermark']}")
+            else:
+                count = db.export_to_json(args.table, args.file)
+                print(f"Exported {count} entries to {args.file}")
 
     except Exception as e:
         print(f"Error: {e}")
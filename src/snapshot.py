@@ -0,0 +1,286 @@
+import re
+import sys
+import time
+import bisect
+import sqlite3
+
+import typing as tp
+
+# field used for prefix lookups when none is given
+LABEL_FIELDS = {
+    "tags": "tag_name",
+    "signatures": "signature",
+    "persons": "last_name",
+    "entities": "entity_name",
+    "emails": "email_address",
+    "phone_numbers": "phone_number",
+}
+
+
+def _record_type(table_name: str, columns: tp.List[str]) -> tp.Type:
+    "Create a read-only __slots__ record class for the columns of a table"
+
+    def __init__(self, values: tp.Sequence[tp.Any]):
+
+        for column, value in zip(columns, values):
+
+            object.__setattr__(self, column, value)
+
+    def __setattr__(self, name: str, value: tp.Any):
+
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key: str) -> tp.Any:
+
+        return getattr(self, key)
+
+    def keys(self) -> tp.List[str]:
+
+        return list(columns)
+
+    def as_dict(self) -> tp.Dict[str, tp.Any]:
+
+        return {column: getattr(self, column) for column in columns}
+
+    def __repr__(self) -> str:
+
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+    name = "".join(part.title() for part in table_name.split("_")) + "Record"
+
+    return type(
+        name,
+        (),
+        {
+            "__slots__": tuple(columns),
+            "__init__": __init__,
+            "__setattr__": __setattr__,
+            "__getitem__": __getitem__,
+            "keys": keys,
+            "as_dict": as_dict,
+            "__repr__": __repr__,
+        },
+    )
+
+
+class _TableView:
+    "Records of one table with sorted indexes on id and the label field"
+
+    def __init__(self, conn: sqlite3.Connection, table_name: str):
+
+        cursor = conn.execute(f"SELECT * FROM {table_name}")
+        self.columns = [d[0] for d in cursor.description]
+        self.record = _record_type(table_name, self.columns)
+        self.label = LABEL_FIELDS.get(table_name)
+
+        self.rows: tp.Dict[str, tp.Any] = {}
+
+        for values in cursor:
+
+            record = self.record(tuple(values))
+            self.rows[record.id] = record
+
+        # parallel sorted arrays for bisect based prefix lookup
+        self.indexes: tp.Dict[str, tp.Tuple[tp.List[str], tp.List[str]]] = {}
+
+        for field in filter(None, ["id", self.label]):
+
+            pairs = sorted(
+                (str(getattr(r, field)), r.id)
+                for r in self.rows.values()
+                if getattr(r, field) is not None
+            )
+            self.indexes[field] = ([k for k, _ in pairs], [i for _, i in pairs])
+
+    def prefix(self, prefix: str, field: str) -> tp.List[tp.Any]:
+
+        if field not in self.indexes:
+
+            raise ValueError("No prefix index on field: {}".format(field))
+
+        keys, ids = self.indexes[field]
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "\U0010ffff", lo=start)
+
+        return [self.rows[entry_id] for entry_id in ids[start:end]]
+
+    def footprint(self) -> int:
+        "Approximate bytes held by the records, their values and the indexes"
+
+        size = sys.getsizeof(self.rows)
+
+        for record in self.rows.values():
+
+            size += sys.getsizeof(record)
+            size += sum(sys.getsizeof(getattr(record, c)) for c in self.columns)
+
+        for keys, ids in self.indexes.values():
+
+            size += sys.getsizeof(keys) + sys.getsizeof(ids)
+            size += sum(sys.getsizeof(k) for k in keys)
+
+        return size
+
+
+class Snapshot:
+    """
+    Read-only in-memory copy of some tables for read heavy workloads.
+
+    Lookups are served from dicts of __slots__ records and sorted arrays
+    without going through sqlite. The snapshot reads through its own
+    read-only connection, so it never touches a transaction open on the
+    DBManager connection.
+
+    Staleness is checked against PRAGMA data_version, which changes when
+    another connection commits. By default that only happens in refresh(),
+    so lookups may return rows that were changed since the last load. With
+    auto_refresh set, lookups check at most once per auto_refresh seconds
+    (0 checks on every lookup) and reload when the database changed.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        tables: tp.List[str],
+        auto_refresh: tp.Optional[float] = None,
+    ):
+
+        # owned by the snapshot, opened in autocommit mode by DBManager
+        self.conn: tp.Optional[sqlite3.Connection] = conn
+        self.table_names = list(tables)
+        self.tables: tp.Dict[str, _TableView] = {}
+        self.version: tp.Optional[int] = None
+        self.auto_refresh = auto_refresh
+        self.checked_at = time.monotonic()
+
+        self._load()
+
+    def _current_version(self) -> int:
+
+        assert self.conn is not None, "Snapshot is closed"
+
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self):
+
+        assert self.conn is not None, "Snapshot is closed"
+
+        # one read transaction so all tables come from the same state
+        self.conn.execute("BEGIN")
+
+        try:
+
+            self.tables = {t: _TableView(self.conn, t) for t in self.table_names}
+            self.version = self._current_version()
+
+        finally:
+
+            self.conn.execute("COMMIT")
+
+    def _view(self, table_name: str) -> _TableView:
+
+        if self.auto_refresh is not None and self.conn is not None:
+
+            now = time.monotonic()
+
+            if now - self.checked_at >= self.auto_refresh:
+
+                self.checked_at = now
+                self.refresh()
+
+        if table_name not in self.tables:
+
+            raise ValueError("Table not in snapshot: {}".format(table_name))
+
+        return self.tables[table_name]
+
+    def is_stale(self) -> bool:
+        """Whether the database changed since the snapshot was loaded."""
+
+        return self._current_version() != self.version
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload when the database changed, returns whether it reloaded."""
+
+        if not force and not self.is_stale():
+
+            return False
+
+        self._load()
+        self.checked_at = time.monotonic()
+
+        return True
+
+    def get(self, table_name: str, entry_id: str) -> tp.Optional[tp.Any]:
+        """Get a record by id."""
+
+        return self._view(table_name).rows.get(entry_id)
+
+    def prefix(
+        self, table_name: str, prefix: str, field: tp.Optional[str] = None
+    ) -> tp.List[tp.Any]:
+        """
+        Records whose field starts with prefix, in sorted order. The field
+        defaults to the label of the table (tag_name for tags, signature for
+        signatures), or id when the table has none.
+        """
+
+        view = self._view(table_name)
+
+        return view.prefix(prefix, field or view.label or "id")
+
+    def search(
+        self, table_name: str, pattern: str, field: tp.Optional[str] = None
+    ) -> tp.List[tp.Any]:
+        """Records matching a regex pattern, like DBManager.search_entries."""
+
+        view = self._view(table_name)
+        regex = re.compile(pattern, re.IGNORECASE)
+
+        if field and field not in view.columns:
+
+            raise ValueError("Invalid field for {}: {}".format(table_name, field))
+
+        fields = [field] if field else view.columns
+        results = []
+
+        for record in view.rows.values():
+
+            for f in fields:
+
+                value = getattr(record, f)
+
+                if field and value:
+
+                    value = str(value)
+
+                if value and isinstance(value, str) and regex.search(value):
+
+                    results.append(record)
+                    break
+
+        return results
+
+    def close(self):
+        """
+        Close the snapshot's connection, loaded records stay usable but are
+        no longer refreshed.
+        """
+
+        if self.conn:
+
+            self.conn.close()
+            self.conn = None
+
+    def memory_footprint(self) -> tp.Dict[str, tp.Any]:
+        """Approximate memory held per table, in bytes."""
+
+        tables = {
+            name: {"rows": len(view.rows), "bytes": view.footprint()}
+            for name, view in self.tables.items()
+        }
+
+        return {
+            "tables": tables,
+            "total_bytes": sum(t["bytes"] for t in tables.values()),
+        }
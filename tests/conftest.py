@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# modules in src import each other by bare name, like when run as scripts
+sys.path.insert(0, str(ROOT / "src"))
+
+from db_manager import DBManager, DBConfig  # noqa: E402
+
+
+def make_db(directory: Path) -> DBManager:
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    config = DBConfig(
+        str(directory / "database.sqlite"),
+        str(directory / "backups"),
+        str(ROOT / "configs" / "schema.sql"),
+        str(ROOT / "configs" / "prefixes.json"),
+    )
+
+    return DBManager(config)
+
+
+@pytest.fixture
+def db(tmp_path):
+
+    manager = make_db(tmp_path / "source")
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def other_db(tmp_path):
+
+    manager = make_db(tmp_path / "target")
+    yield manager
+    manager.close()
@@ -0,0 +1,82 @@
+import json
+
+from dedupe import DedupeEngine
+
+
+def test_merge_repoints_exact_ids_only(db):
+
+    keep = db.add_entry(
+        "persons", {"id": "pe3", "first_name": "Jane", "last_name": "Doe"}
+    )
+    drop = db.add_entry(
+        "persons", {"id": "pe1111", "first_name": "Jane", "last_name": "Do"}
+    )
+    other = db.add_entry(
+        "persons", {"id": "pe11112222", "first_name": "John", "last_name": "Roe"}
+    )
+
+    db.add_entry("emails", {"email_address": "jane@example.com", "owner": drop})
+    db.add_entry("phone_numbers", {"phone_number": "5550100", "owner": drop})
+    shared = db.add_entry(
+        "addresses",
+        {
+            "longitude": "1.000000",
+            "latitude": "2.000000",
+            "current_occupants": json.dumps([other, drop, keep]),
+            "past_occupants": json.dumps([drop]),
+        },
+    )
+    untouched = db.add_entry(
+        "addresses",
+        {
+            "longitude": "3.000000",
+            "latitude": "4.000000",
+            "current_occupants": json.dumps([other]),
+            "past_occupants": f"{drop} not json",
+        },
+    )
+
+    counts = DedupeEngine(db).merge("persons", keep, drop)
+
+    assert counts == {"emails": 1, "phone_numbers": 1, "addresses": 1}
+    assert db.get_entry_by_id("persons", drop) is None
+
+    address = db.get_entry_by_id("addresses", shared)
+    assert json.loads(address["current_occupants"]) == [other, keep]
+    assert json.loads(address["past_occupants"]) == [keep]
+
+    address = db.get_entry_by_id("addresses", untouched)
+    assert json.loads(address["current_occupants"]) == [other]
+    assert address["past_occupants"] == f"{drop} not json"
+
+    for table_name in ("emails", "phone_numbers"):
+
+        assert [row["owner"] for row in db.list_entries(table_name)] == [keep]
+
+
+def test_candidates_follow_writes(db):
+
+    engine = DedupeEngine(db)
+
+    first = db.add_entry("persons", {"first_name": "Jon", "last_name": "Smyth"})
+    second = db.add_entry("persons", {"first_name": "John", "last_name": "Smith"})
+    robert = db.add_entry(
+        "persons",
+        {"first_name": "Robert", "last_name": "Stone", "preferred_name": "Bob"},
+    )
+
+    pairs = [{c["id_a"], c["id_b"]} for c in engine.find_candidates("persons", 0.5)]
+    assert pairs == [{first, second}]
+
+    # only the written entry is re-keyed on the next run
+    third = db.add_entry("persons", {"first_name": "Bob", "last_name": "Stone"})
+    db.add_entry("emails", {"email_address": "b.stone+x@gmail.com", "owner": third})
+
+    assert engine.refresh_keys("persons") > 0
+    assert engine.refresh_keys("persons") == 0
+
+    db.delete_entry("persons", second)
+
+    pairs = [{c["id_a"], c["id_b"]} for c in engine.find_candidates("persons", 0.5)]
+    assert {first, second} not in pairs
+    assert {robert, third} in pairs
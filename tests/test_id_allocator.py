@@ -0,0 +1,103 @@
+import json
+import re
+
+import pytest
+
+from id_allocator import IDAllocator
+
+
+@pytest.fixture
+def allocator(db):
+
+    return IDAllocator(db.conn, db.prefixes)
+
+
+def test_batch_is_unique_and_prefixed(db, allocator):
+
+    prefix = db.prefixes["tags"]
+    ids = allocator.allocate("tags", 2000)
+
+    assert len(ids) == len(set(ids)) == 2000
+    assert all(re.fullmatch(re.escape(prefix) + "[0-9a-f]{8}", i) for i in ids)
+
+
+def test_existing_ids_are_regenerated(db, allocator, monkeypatch):
+
+    prefix = db.prefixes["tags"]
+    db.add_entry("tags", {"id": f"{prefix}00000000", "tag_name": "taken"})
+
+    # first candidate collides with the table, second repeats within the batch
+    suffixes = iter(["00000000", "00000001", "00000001", "00000002"])
+    monkeypatch.setattr(allocator, "_random_hex", lambda: next(suffixes))
+
+    assert allocator.allocate("tags", 2) == [f"{prefix}00000001", f"{prefix}00000002"]
+
+
+def test_gives_up_after_max_attempts(db, monkeypatch):
+
+    prefix = db.prefixes["tags"]
+    db.add_entry("tags", {"id": f"{prefix}00000000", "tag_name": "taken"})
+
+    allocator = IDAllocator(db.conn, db.prefixes, max_attempts=3)
+    calls = []
+
+    def taken() -> str:
+
+        calls.append(1)
+
+        return "00000000"
+
+    monkeypatch.setattr(allocator, "_random_hex", taken)
+
+    with pytest.raises(RuntimeError):
+
+        allocator.allocate("tags", 1)
+
+    assert len(calls) == 3
+
+
+def test_time_scheme_ids_are_ordered(db):
+
+    prefix = db.prefixes["tags"]
+    allocator = IDAllocator(db.conn, db.prefixes, scheme="time", suffix_length=4)
+    first = allocator.allocate("tags", 10)
+    second = allocator.allocate("tags", 10)
+
+    for entry_id in first + second:
+
+        assert entry_id.startswith(prefix)
+        assert len(entry_id) == len(prefix) + 12 + 4
+
+    assert max(i[: len(prefix) + 12] for i in first) <= min(
+        i[: len(prefix) + 12] for i in second
+    )
+
+
+def test_invalid_settings_are_rejected(db):
+
+    with pytest.raises(ValueError):
+
+        IDAllocator(db.conn, db.prefixes, scheme="uuid")
+
+    with pytest.raises(ValueError):
+
+        IDAllocator(db.conn, db.prefixes, suffix_length=0)
+
+
+def test_invalid_entries_do_not_abort_the_batch(db, tmp_path, capsys):
+
+    entries = [{"tag_name": "a"}, "bad", {"tag_name": "b"}, {"id": "kept"}]
+    db.assign_ids("tags", entries)
+
+    assert entries[1] == "bad"
+    assert entries[3] == {"id": "kept"}
+    assert entries[0]["id"] != entries[2]["id"]
+
+    json_file = tmp_path / "tags.json"
+    json_file.write_text(
+        json.dumps([{"tag_name": f"tag{i}"} for i in range(1000)] + ["bad"])
+    )
+
+    assert db.import_from_json("tags", str(json_file)) == 1000
+    assert "Error importing entry" in capsys.readouterr().out
+    assert len(db.list_entries("tags")) == 1000
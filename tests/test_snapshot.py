@@ -0,0 +1,36 @@
+def test_snapshot_refreshes_on_request(db):
+
+    first = db.add_entry("tags", {"tag_name": "work"})
+    snap = db.snapshot(["tags"])
+
+    db.update_entry("tags", first, {"tag_name": "office"})
+
+    # stale until the caller refreshes
+    assert snap.get("tags", first).tag_name == "work"
+    assert snap.is_stale()
+    assert snap.refresh()
+    assert snap.get("tags", first).tag_name == "office"
+    assert not snap.refresh()
+
+
+def test_snapshot_auto_refresh(db):
+
+    first = db.add_entry("tags", {"tag_name": "work"})
+    snap = db.snapshot(["tags"], auto_refresh=0)
+
+    db.update_entry("tags", first, {"tag_name": "office"})
+    second = db.add_entry("tags", {"tag_name": "personal"})
+
+    assert snap.get("tags", first).tag_name == "office"
+    assert [r.id for r in snap.prefix("tags", "pers")] == [second]
+
+
+def test_close_closes_open_snapshots(db):
+
+    db.add_entry("tags", {"tag_name": "work"})
+    snap = db.snapshot(["tags"], auto_refresh=0)
+
+    db.close()
+
+    assert snap.conn is None
+    assert [r.tag_name for r in snap.prefix("tags", "w")] == ["work"]
@@ -0,0 +1,106 @@
+from conftest import make_db
+
+
+def rows_by_id(db, table_name):
+
+    return {row["id"]: row for row in db.list_entries(table_name)}
+
+
+def test_changeset_round_trip(db, other_db, tmp_path):
+
+    first = db.add_entry("tags", {"tag_name": "work"})
+    second = db.add_entry("tags", {"tag_name": "personal"})
+
+    full = tmp_path / "full.json"
+    result = db.export_changes("tags", "2000-01-01", str(full))
+
+    assert result == {"rows": 2, "deleted": 0, "watermark": result["watermark"]}
+    assert other_db.upsert_from_json("tags", str(full)) == {
+        "upserted": 2,
+        "deleted": 0,
+    }
+    assert rows_by_id(other_db, "tags") == rows_by_id(db, "tags")
+
+    db.update_entry("tags", first, {"description": "changed"})
+    db.delete_entry("tags", second)
+    third = db.add_entry("tags", {"tag_name": "research"})
+
+    changes = tmp_path / "changes.json"
+    result = db.export_changes("tags", result["watermark"], str(changes))
+
+    assert result["deleted"] == 1
+
+    # applying the same changeset twice must not duplicate or fail
+    for _ in range(2):
+
+        other_db.upsert_from_json("tags", str(changes))
+
+    target = rows_by_id(other_db, "tags")
+
+    assert set(target) == {first, third}
+    assert target[first]["description"] == "changed"
+    assert target == rows_by_id(db, "tags")
+
+
+def test_readded_entry_clears_tombstone(db, tmp_path):
+
+    entry_id = db.add_entry("tags", {"tag_name": "work"})
+    db.delete_entry("tags", entry_id)
+    db.add_entry("tags", {"id": entry_id, "tag_name": "work"})
+
+    changes = tmp_path / "changes.json"
+    result = db.export_changes("tags", "2000-01-01", str(changes))
+
+    assert result["rows"] == 1
+    assert result["deleted"] == 0
+
+
+def test_export_leaves_open_transaction_alone(db, tmp_path):
+
+    assert db.conn is not None
+    db.conn.execute("INSERT INTO tags (id, tag_name) VALUES ('ta00000000', 'open')")
+
+    db.export_changes("tags", "2000-01-01", str(tmp_path / "changes.json"))
+    db.conn.rollback()
+
+    assert db.get_entry_by_id("tags", "ta00000000") is None
+
+
+def test_migrated_database_has_no_update_counts(tmp_path):
+
+    db = make_db(tmp_path / "old")
+    assert db.conn is not None
+
+    # simulate a database from before last_updated existed
+    db.conn.executescript("""
+        CREATE TABLE tags_old AS SELECT id, tag_name FROM tags;
+        DROP TABLE tags;
+        CREATE TABLE tags (
+               id TEXT PRIMARY KEY UNIQUE,
+               tag_name TEXT NOT NULL UNIQUE,
+               description TEXT,
+               date_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+               last_added DATETIME DEFAULT CURRENT_TIMESTAMP,
+               update_history TEXT
+        );
+        INSERT INTO tags (id, tag_name) VALUES ('ta00000001', 'old');
+        """)
+
+    # dropping the table dropped its triggers, restore them like an older
+    # build of the stats feature would have left them
+    db._create_stats_triggers()
+    db.close()
+
+    db = make_db(tmp_path / "old")
+
+    assert db.get_stats()["most_updated"] == []
+
+    # the backfill has the shape of the column default, so exporting from
+    # the row's own timestamp includes it
+    last_updated = db.get_entry_by_id("tags", "ta00000001")["last_updated"]
+    changes = tmp_path / "changes.json"
+
+    assert len(last_updated) == len("2000-01-01 00:00:00.000")
+    assert db.export_changes("tags", last_updated, str(changes))["rows"] == 1
+
+    db.close()